@@ -15,10 +15,13 @@
 '''A program for playing with texture expansion. 
 
 Methods:
-compare -- find (square of) colour-space distance between two pixels
-compareRegion -- find weighted sum of colour-space distances between all
-    pixels in two texture regions
 expand -- expand one texture into another
+inpaint -- fill masked pixels of a texture from the rest of it
+onionOrder -- order the uninitialised pixels of a texture from the 
+    boundary inward
+
+compare and compareRegion are re-exported from kernels, which holds the
+matching backends used by expand.
 
 Author: mym
 '''
@@ -26,120 +29,222 @@ Author: mym
 from __future__ import print_function
 #from math import sqrt
 import texture
-#import random
-
-def compare(pix1, pix2):
-    '''Compare two pixels, returning square of the colour-space distance between
-    
-    Arguments:
-    pix1 -- tuple containing the channels of the first pixel
-    pix2 -- tuple containing the channels of the second pixel
-    
-    Return: square of colour space distance
-    
-    Preconditions: both pixels have the same number of channels
-    '''
-    assert len(pix1) == len(pix2)
-    collect = 0
-    for pair in zip(pix1, pix2):
-        collect += (pair[0] - pair[1])**2
-    return collect
-
-def compareRegion(tex1, tex2, cen1, cen2, region):
-    '''Compare regions of two Textures.
-    Returns the weighted sum of colour-space distances between corresponding
-    pixels, or Infinity if no pixels can be compared.
-    
-    Arguments:
-    tex1, tex2 -- Textures to compare
-    cen1, cen2 -- 2-tuple centres of comparison regions
-    region -- list of 2-tuple shifts defining points for comparison
-    
-    Returns: floating-point weighted sum of distances
-    
-    Preconditions: region is valid about cen in both textures (untested)
-    '''
-    # abort if nothing to compare (avoid divide-by-zero)
-    if (len(region) == 0): return float('inf')
-    
-    # loop over shifts
-    total = 0
-    for shift in region:
-        p1 = tex1.getPixel(cen1, shift)
-        p2 = tex2.getPixel(cen2, shift)
-        total += compare(p1, p2)
-    
-    # weight by number of points compared
-    return float(total)/len(region)
+import kernels
+import collections
+import time
+from kernels import compare, compareRegion
+import random
 
-def expand(source, target, near):
+def expand(source, target, near, backend = "python", 
+           slist = None, tlist = None, threads = 1, quantum = None,
+           deadline = None, sample = 64, cancel = None, report = None):
     '''Expands the source texture into larger output
     
     Arguments:
     source -- Source Texture used to be expanded
     target -- Target Texture to guide expansion
     near -- Shape used for comparisons
+    backend -- name of the kernels backend used for matching 
+        (def. "python")
+    slist -- list of 2-tuple candidate locations in the source 
+        (def. None, every pixel)
+    tlist -- list of 2-tuple locations in the target to synthesise, in
+        order (def. None, every pixel in row order)
+    threads -- number of threads each pixel's candidates are scanned with
+        (def. 1)
+    quantum -- if given, look each pixel up in a kernels.NeighbourhoodIndex
+        with this quantum first, searching only if it has no match; the
+        best candidate with the same quantised neighbourhood is used, 
+        which may differ from the search's choice (def. None, always 
+        search)
+    deadline -- seconds after which each remaining pixel is matched 
+        against a random sample of candidates rather than all of them 
+        (def. None, never)
+    sample -- number of candidates sampled after the deadline (def. 64)
+    cancel -- threading.Event; once set, expansion stops and the target
+        is returned as it stands (def. None, run to the end)
+    report -- dictionary to fill with a [pixels, seconds] list for each
+        engine: "setup", "index", "search" and "sample", and with 
+        "skipped", the number of pixels left by cancellation (def. None)
     
     Return: an Image containing the expanded texture
+    
+    Preconditions: quantum is None if source and target are the same;
+        sample >= 1
+    
+    If source and target are the same Texture, each synthesised pixel
+    also becomes part of the source for those after it.
     '''
+    # the index is built once, so cannot follow a changing source
+    assert quantum == None or source is not target
+    assert sample >= 1
+    
+    start = time.time()
+    if (report == None): report = {}
+    for engine in ("setup", "index", "search", "sample"):
+        report[engine] = [0, 0.0]
+    report["skipped"] = 0
     
     # make sure the target has the same mode as the source
     if (target.pic.mode != source.pic.mode):
         target.pic = target.pic.convert(source.pic.mode)
             
     # lists of all pixels in source, target for flatter iteration
-    slist = [(x,y) 
-             for y in range(source.pic.size[1])
-             for x in range(source.pic.size[0])]
-    tlist = [(x,y)
-             for y in range(target.pic.size[1])
-             for x in range(target.pic.size[0])]
+    if (slist == None):
+        slist = [(x,y) 
+                 for y in range(source.pic.size[1])
+                 for x in range(source.pic.size[0])]
+    if (tlist == None):
+        tlist = [(x,y)
+                 for y in range(target.pic.size[1])
+                 for x in range(target.pic.size[0])]
+
+    # matching kernel, with the source loaded
+    kernel = kernels.getBackend(backend, threads)
+    kernel.prepare(source, slist)
+    
+    # exact matches, if wanted
+    if (quantum != None):
+        index = kernels.NeighbourhoodIndex(source, slist, near, quantum)
+    else:
+        index = None
+    clock = time.time()
+    report["setup"][1] = clock - start
 
     # for each target pixel...    
-    for tloc in tlist:
+    for (n, tloc) in enumerate(tlist):
+        # leave the rest if cancelled
+        if (cancel != None and cancel.is_set()):
+            report["skipped"] = len(tlist) - n
+            break
+        
         # trim neighbourhood around this point
         nearer = target.goodList(tloc, near.shift, target.valid)
         
-        # clear list of choices
-        choices = []
-        
-        # loop over all source pixels
-        for sloc in slist:
-            # trim above neighbourhood around this point
-            nearest = source.goodList(sloc, nearer, source.valid)
-
-            # weighted texture distance of remaning region
-            weight = compareRegion(source, target, sloc, tloc, nearest)
-            
-            # add tuple of weight and source pixel to choices
-            choices.append((weight, source.getPixel(sloc)))
-            
-        # sort list, pick first
-        # TODO this gives lexical sort; want stable sort on only first element
-        # actually stable gives preference to input order, 
-        # lexical gives preference to colour in RGB order
-        # what order is actually desired? (probably random) 
-        # TODO weighted random choice
-        # sorting actually unnecessary, even for randomness
-        choices.sort()
-        newval = choices[0][1]
-        # shitty randomness - random of first ten
-        #newval = choices[random.randrange(10)][1]
+        # best source pixel for this neighbourhood, from the index if 
+        # it has one
+        newval = None
+        if (index != None):
+            newval = index.lookup(target, tloc)
+            now = time.time()
+            report["index"][1] += now - clock
+            clock = now
+            if (newval != None): report["index"][0] += 1
+        if (newval == None):
+            # search every candidate, or a sample once out of time
+            if (deadline != None and clock - start > deadline):
+                engine = "sample"
+                candidates = random.sample(slist, min(sample, len(slist)))
+            else:
+                engine = "search"
+                candidates = None
+            newval = kernel.match(target, tloc, nearer, candidates)[1]
+            now = time.time()
+            report[engine][0] += 1
+            report[engine][1] += now - clock
+            clock = now
         
         # set the pixel!
         target.setPixel(newval, tloc)
         target.setValid(tloc)
+        if (source is target): kernel.update(tloc)
         
         # progress?
         if (tloc[0] == 0): print("\nrow ", tloc[1], end = "")
         print(".", end = "")
+    kernel.close()
         
     # convert to an Image and return  
     return target.toImage()    
 
+def inpaint(target, mask, near, backend = "python", threads = 1,
+            deadline = None, sample = 64, cancel = None, report = None):
+    '''Fill the masked pixels of a texture from the rest of it
+    
+    Masked pixels are marked uninitialised and synthesised in onion order,
+    matched against the unmasked pixels of the same texture. Only the
+    masked pixels are searched for, so the work scales with the hole.
+    
+    Arguments:
+    target -- Texture to be filled; modified in place
+    mask -- Image of the same size as target, non-zero where pixels are 
+        to be filled
+    near -- Shape used for comparisons, normally a SquareShape
+    backend -- name of the kernels backend used for matching 
+        (def. "python")
+    threads -- number of threads each pixel's candidates are scanned with
+        (def. 1)
+    deadline, sample, cancel, report -- time limits and report, as for 
+        expand
+    
+    Return: an Image containing the filled texture
+    
+    Preconditions: mask does not cover the whole texture
+    '''
+    assert mask.size == target.pic.size
+    
+    # knock out the masked pixels, keep the rest as candidates
+    width = target.pic.size[0]
+    slist = []
+    for (i, value) in enumerate(mask.convert("L").getdata()):
+        loc = (i % width, i // width)
+        if (value != 0):
+            target.setInvalid(loc)
+        else:
+            slist.append(loc)
+    assert len(slist) > 0
+            
+    return expand(target, target, near, backend, slist, onionOrder(target),
+                  threads, deadline = deadline, sample = sample, 
+                  cancel = cancel, report = report)
+
+def onionOrder(tex):
+    '''Order the uninitialised pixels of a texture from the boundary inward
+    
+    Pixels are taken in layers: first those next to (including diagonally)
+    an initialised pixel, then those next to the first layer, and so on.
+    
+    Arguments:
+    tex -- Texture whose uninitialised pixels are to be ordered
+    
+    Returns: list of 2-tuple locations of every uninitialised pixel
+    '''
+    (width, height) = tex.pic.size
+    holes = [(x,y)
+             for y in range(height)
+             for x in range(width)
+             if not tex.valid[tex._index((x,y))]]
+    ring = [(i,j) 
+            for j in range(-1, 2) 
+            for i in range(-1, 2) 
+            if (i,j) != (0,0)]
+    
+    # first layer borders initialised pixels
+    order = [loc for loc in holes if tex.goodList(loc, ring, tex.valid)]
+    if (len(order) == 0):
+        # nothing initialised to peel from
+        return holes
+    
+    # breadth-first inward from there
+    seen = set(order)
+    queue = collections.deque(order)
+    while (len(queue) > 0):
+        loc = queue.popleft()
+        for shift in ring:
+            point = (loc[0] + shift[0], loc[1] + shift[1])
+            if (tex._locTest(point) and point not in seen 
+                and not tex.valid[tex._index(point)]):
+                seen.add(point)
+                order.append(point)
+                queue.append(point)
+    return order
+
 if __name__ == '__main__':
     # additional imports
     import argparse
+    import os
+    import signal
+    import threading
     from PIL import Image
 
     # use the first line of the docstring as the program description
@@ -157,21 +262,61 @@ if __name__ == '__main__':
     parser.add_argument("-target", dest="target_file", 
                         help="image for target of synthesis")
     # untargeted synthesis scale
-    parser.add_argument("-scale", default = 2, type = int,
-                        help="Scale factor for generated texture (ignored if targeted)")
+    parser.add_argument("-scale", type = int,
+                        help="Scale factor for generated texture (default 2, ignored if targeted)")
     # neighbourhood size
     parser.add_argument("-nsize", default = 2, type = int,
                         help = "Size of neighbourhood used in comparisons")
+    # hole filling
+    parser.add_argument("-mask", dest = "mask_file",
+                        help = "image marking pixels of the input to fill in (non-zero), instead of expanding it (not with -target or -scale)")
+    # matching kernel
+    parser.add_argument("-backend", default = "python", 
+                        choices = kernels.available(),
+                        help = "Kernel used to match neighbourhoods")
+    # parallel candidate scan
+    parser.add_argument("-threads", default = 1, type = int,
+                        help = "Number of threads to scan candidates with (ignored by the python backend)")
+    # exact match index
+    parser.add_argument("-hash", dest = "quantum", type = int, metavar = "step",
+                        help = "look up matching neighbourhoods first, with channels quantised to this step (1 for exact), searching only if there are none; may pick a different pixel than a full search (not with -mask)")
+    # time limit
+    parser.add_argument("-deadline", type = float, metavar = "seconds",
+                        help = "sample candidates for pixels left after this long")
+    parser.add_argument("-sample", default = 64, type = int,
+                        help = "Number of candidates sampled after the deadline")
+    # memory-mapped textures
+    parser.add_argument("-mapdir", dest = "map_dir", metavar = "directory",
+                        help = "keep source and target in map files in this directory")
     # activate profiler
     parser.add_argument("-prof", metavar = "filename", 
                         help = "run profiler and save results")
 
     args = parser.parse_args()
+    if (args.mask_file != None and args.quantum != None):
+        parser.error("-hash cannot be used with -mask")
+    if (args.quantum != None and args.quantum < 1):
+        parser.error("-hash step must be at least 1")
+    if (args.mask_file != None and 
+        (args.target_file != None or args.scale != None)):
+        parser.error("-target and -scale cannot be used with -mask")
+    if (args.scale == None):
+        args.scale = 2
+    if (args.sample < 1):
+        parser.error("-sample must be at least 1")
+    if (args.threads < 1):
+        parser.error("-threads must be at least 1")
 
     # Read the source image
     try:
         source_image = Image.open(args.input_file)
-        source = texture.Texture(source_image)
+        if (args.map_dir == None):
+            source = texture.Texture(source_image)
+        else:
+            # hole filling writes back into the source
+            source = texture.MappedTexture(
+                os.path.join(args.map_dir, "source.map"), source_image,
+                readonly = (args.mask_file == None))
     except IOError:
         print("Could not open input image file", args.input_file)
         exit(1)
@@ -179,11 +324,33 @@ if __name__ == '__main__':
     # Create target image and neighbourhood
     # SquareShape for targeted (looks ahead), 
     # EllShape for untargeted (only looks at initialised)
-    if (args.target_file != None):
+    if (args.mask_file != None):
+        # fill the source in place, so it is its own target
+        try:
+            mask_image = Image.open(args.mask_file)
+            shape = texture.SquareShape(args.nsize)
+        except IOError:
+            print("Could not open mask image file", args.mask_file)
+            exit(1)
+        # inpaint needs a matching mask with something left unmasked
+        if (mask_image.size != source_image.size):
+            print("Mask image", args.mask_file, "is not the size of",
+                  args.input_file)
+            exit(1)
+        if (mask_image.convert("L").getextrema()[0] != 0):
+            print("Mask image", args.mask_file, "covers the whole of",
+                  args.input_file)
+            exit(1)
+    elif (args.target_file != None):
         # read from file if one is specified
         try:
             target_image = Image.open(args.target_file)
-            target = texture.Texture(target_image)
+            if (args.map_dir == None):
+                target = texture.Texture(target_image)
+            else:
+                target = texture.MappedTexture(
+                    os.path.join(args.map_dir, "target.map"), target_image,
+                    readonly = False)
             shape = texture.SquareShape(args.nsize)
         except IOError:
             print("Could not open target image file", args.target_file)
@@ -192,15 +359,41 @@ if __name__ == '__main__':
         # no target specified, create a blank one
         tsize = (args.scale * source_image.size[0],
                  args.scale * source_image.size[1])
-        target = texture.EmptyTexture(tsize, source_image.mode)
+        if (args.map_dir == None):
+            target = texture.EmptyTexture(tsize, source_image.mode)
+        else:
+            target = texture.MappedEmptyTexture(
+                os.path.join(args.map_dir, "target.map"), tsize, 
+                source_image.mode)
         shape = texture.EllShape(args.nsize)
             
     # Perform the expansion
+    # first interrupt stops early and keeps what is done so far
+    cancel = threading.Event()
+    signal.signal(signal.SIGINT, lambda signum, frame: cancel.set())
+    report = {}
+    if (args.mask_file != None):
+        run = lambda: inpaint(source, mask_image, shape, args.backend, 
+                              args.threads, args.deadline, args.sample, 
+                              cancel, report)
+    else:
+        run = lambda: expand(source, target, shape, args.backend, 
+                             threads = args.threads, quantum = args.quantum,
+                             deadline = args.deadline, sample = args.sample,
+                             cancel = cancel, report = report)
     if (args.prof == None):
-        expansion = expand(source, target, shape)
+        expansion = run()
     else:
         import cProfile
-        cProfile.run("expansion = expand(source, target, shape)", args.prof)
+        cProfile.run("expansion = run()", args.prof)
+    signal.signal(signal.SIGINT, signal.default_int_handler)
+    
+    # time taken by each engine
+    print()
+    for engine in ("setup", "index", "search", "sample"):
+        print(engine, report[engine][0], "pixels", 
+              "%.2f" % report[engine][1], "seconds")
+    print("skipped", report["skipped"], "pixels")
     
     # Write the final image
     try:
@@ -0,0 +1,719 @@
+# Copyright 2015 Myriam Johnson
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#     http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''Matching kernels for texture expansion
+
+For each target pixel, expand scores every candidate source pixel by the
+distance between their neighbourhoods and takes the best. A Backend
+implements that scan; backends are registered here by name so that the
+fastest one available can be chosen at run time. Every backend must pick
+the same pixels as the reference PythonBackend.
+
+Methods:
+compare -- find (square of) colour-space distance between two pixels
+compareRegion -- find weighted sum of colour-space distances between all
+    pixels in two texture regions
+register -- add a Backend class to the registry
+available -- list the names of registered backends
+getBackend -- create a registered Backend by name
+
+class Backend -- base class for matching kernels
+class PythonBackend (subclasses Backend) -- reference kernel in pure Python
+class NumpyBackend (subclasses Backend) -- vectorised kernel, registered
+    as "numpy" if NumPy is installed
+class NumbaBackend (subclasses NumpyBackend) -- JIT-compiled kernel,
+    registered as "numba" if Numba is installed
+class SlidingBackend (subclasses NumpyBackend) -- vectorised kernel reusing
+    column sums along a row, registered as "sliding" if NumPy is installed
+class NeighbourhoodIndex -- hash index from neighbourhood contents to source
+    pixels, for finding exact matches without a scan
+'''
+
+import texture
+from multiprocessing.pool import ThreadPool
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+def compare(pix1, pix2):
+    '''Compare two pixels, returning square of the colour-space distance between
+
+    Arguments:
+    pix1 -- tuple containing the channels of the first pixel
+    pix2 -- tuple containing the channels of the second pixel
+
+    Return: square of colour space distance
+
+    Preconditions: both pixels have the same number of channels
+    '''
+    assert len(pix1) == len(pix2)
+    collect = 0
+    for pair in zip(pix1, pix2):
+        collect += (pair[0] - pair[1])**2
+    return collect
+
+def compareRegion(tex1, tex2, cen1, cen2, region):
+    '''Compare regions of two Textures.
+    Returns the weighted sum of colour-space distances between corresponding
+    pixels, or Infinity if no pixels can be compared.
+
+    Arguments:
+    tex1, tex2 -- Textures to compare
+    cen1, cen2 -- 2-tuple centres of comparison regions
+    region -- list of 2-tuple shifts defining points for comparison
+
+    Returns: floating-point weighted sum of distances
+
+    Preconditions: region is valid about cen in both textures (untested)
+    '''
+    # abort if nothing to compare (avoid divide-by-zero)
+    if (len(region) == 0): return float('inf')
+
+    # loop over shifts
+    total = 0
+    for shift in region:
+        p1 = tex1.getPixel(cen1, shift)
+        p2 = tex2.getPixel(cen2, shift)
+        total += compare(p1, p2)
+
+    # weight by number of points compared
+    return float(total)/len(region)
+
+# backend classes by name
+_registry = {}
+
+def register(name, backend):
+    '''Add a Backend class to the registry
+
+    Arguments:
+    name -- string name used to select the backend
+    backend -- Backend subclass, constructed with the number of threads
+
+    Postconditions: name is listed by available; an existing backend of
+        the same name is replaced
+    '''
+    _registry[name] = backend
+
+def available():
+    '''List the names of registered backends
+
+    Returns: sorted list of backend names
+    '''
+    return sorted(_registry)
+
+def getBackend(name, threads = 1):
+    '''Create a registered Backend by name
+
+    Arguments:
+    name -- string name of the backend
+    threads -- number of threads to scan candidates with (def. 1)
+
+    Returns: a new, unprepared instance of the backend
+
+    Raises: ValueError if no backend is registered under name
+    '''
+    if (name not in _registry):
+        raise ValueError("Unknown backend " + name + ", expected one of "
+                         + ", ".join(available()))
+    return _registry[name](threads)
+
+class Backend:
+    '''Base class for matching kernels.
+
+    A Backend is prepared once with the source texture and its candidate
+    pixels, then asked for the best match for each target pixel in turn.
+    Base Backend cannot match; use a subclass.
+
+    Methods:
+    prepare -- set the source texture and candidate list
+    match -- find the best candidate for a target pixel
+    update -- note that a source pixel has changed since prepare
+    close -- release any threads held by this backend
+
+    Class variables:
+    threads -- number of threads to scan candidates with
+    source -- the source Texture
+    slist -- list of 2-tuple candidate locations in the source
+    '''
+
+    def __init__(self, threads = 1):
+        '''Constructor
+
+        Arguments:
+        threads -- number of threads to scan candidates with (def. 1);
+            backends which cannot scan in parallel ignore this
+
+        Preconditions: threads >= 1
+        '''
+        assert threads >= 1
+        self.threads = threads
+
+    def prepare(self, source, slist):
+        '''Set the source texture and candidate list
+
+        Arguments:
+        source -- source Texture
+        slist -- list of 2-tuple candidate locations in the source
+        '''
+        self.source = source
+        self.slist = slist
+
+    def match(self, target, tloc, nearer, candidates = None):
+        '''Find the best candidate for a target pixel
+
+        Candidates are ordered by weight as given by compareRegion, then by
+        pixel value.
+
+        Arguments:
+        target -- target Texture
+        tloc -- 2-tuple location of the pixel in the target
+        nearer -- list of 2-tuple shifts valid about tloc in the target
+        candidates -- list of 2-tuple locations in the source to consider
+            instead of slist (def. None, use slist)
+
+        Returns: 2-tuple of the best weight and the chosen source pixel
+
+        Preconditions: prepare has been called; the candidates are not 
+            empty
+        '''
+        raise NotImplementedError
+
+    def update(self, loc):
+        '''Note that a source pixel has changed since prepare
+
+        Arguments:
+        loc -- 2-tuple location of the changed pixel in the source
+        '''
+        pass
+
+    def close(self):
+        '''Release any threads held by this backend'''
+        pass
+
+class PythonBackend(Backend):
+    '''Reference matching kernel in pure Python.
+
+    Inherits from Backend. Always scans in a single thread. No new methods
+    or variables.
+    '''
+
+    def match(self, target, tloc, nearer, candidates = None):
+        '''Find the best candidate for a target pixel
+
+        See Backend.match
+        '''
+        if (candidates == None): candidates = self.slist
+
+        # clear list of choices
+        choices = []
+
+        # loop over all source pixels
+        for sloc in candidates:
+            # trim above neighbourhood around this point
+            nearest = self.source.goodList(sloc, nearer, self.source.valid)
+
+            # weighted texture distance of remaning region
+            weight = compareRegion(self.source, target, sloc, tloc, nearest)
+
+            # add tuple of weight and source pixel to choices
+            choices.append((weight, self.source.getPixel(sloc)))
+
+        # sort list, pick first
+        # TODO this gives lexical sort; want stable sort on only first element
+        # actually stable gives preference to input order,
+        # lexical gives preference to colour in RGB order
+        # what order is actually desired? (probably random)
+        # TODO weighted random choice
+        # sorting actually unnecessary, even for randomness
+        choices.sort()
+        # shitty randomness - random of first ten
+        #return choices[random.randrange(10)]
+        return choices[0]
+
+class NumpyBackend(Backend):
+    '''Vectorised matching kernel using NumPy.
+
+    Inherits from Backend. The source is copied into arrays at prepare, or
+    for a MappedTexture viewed in place, so a map shared between processes
+    is never copied. Each match scores all candidates at once, one shift at
+    a time. With more than one thread, the candidates are split into shards
+    which are scored on a thread pool, NumPy releasing the GIL for the
+    array work, and the best of each shard compared.
+
+    Class variables:
+    pixels -- (height, width, bpp) array of source pixels
+    valid -- (height, width) boolean array of source validity
+    mapped -- whether pixels and valid are views of a map file
+    ys, xs -- arrays of candidate rows and columns, in slist order
+    shards -- list of 2-tuples of arrays of candidate rows and columns,
+        one for each thread
+    pool -- ThreadPool scanning the shards, or None for a single thread
+    '''
+
+    def prepare(self, source, slist):
+        '''Set the source texture and candidate list
+
+        See Backend.prepare
+        '''
+        Backend.prepare(self, source, slist)
+        (width, height) = source.pic.size
+        self.mapped = isinstance(source, texture.MappedTexture)
+        if (self.mapped):
+            # views straight onto the mapping; flags are stored as 0 or 1
+            self.pixels = numpy.frombuffer(
+                source.pixels.mapping, dtype = numpy.uint8, 
+                count = source.pixels.count * source.bpp,
+                offset = source.pixels.offset
+                ).reshape(height, width, source.bpp)
+            self.valid = numpy.frombuffer(
+                source.valid.mapping, dtype = bool, 
+                count = source.valid.count, offset = source.valid.offset
+                ).reshape(height, width)
+        else:
+            self.pixels = numpy.array(source.pixels, dtype = numpy.uint8
+                                      ).reshape(height, width, source.bpp)
+            self.valid = numpy.array(source.valid, dtype = bool
+                                     ).reshape(height, width)
+        self.ys = numpy.array([loc[1] for loc in slist], dtype = numpy.int64)
+        self.xs = numpy.array([loc[0] for loc in slist], dtype = numpy.int64)
+
+        # contiguous shards of candidates, none empty
+        self.shards = [shard for shard in 
+                       zip(numpy.array_split(self.ys, self.threads),
+                           numpy.array_split(self.xs, self.threads))
+                       if len(shard[0]) > 0]
+        if (len(self.shards) > 1):
+            self.pool = ThreadPool(len(self.shards))
+        else:
+            self.pool = None
+
+    def update(self, loc):
+        '''Note that a source pixel has changed since prepare
+
+        See Backend.update
+        '''
+        # a view of the map already sees the change
+        if (self.mapped): return
+        self.pixels[loc[1], loc[0]] = self.source.getPixel(loc)
+        self.valid[loc[1], loc[0]] = self.source.valid[self.source._index(loc)]
+
+    def match(self, target, tloc, nearer, candidates = None):
+        '''Find the best candidate for a target pixel
+
+        See Backend.match
+        '''
+        (shifts, values) = self._region(target, tloc, nearer)
+        if (candidates != None):
+            # a few candidates, not worth sharding
+            ys = numpy.array([loc[1] for loc in candidates], dtype = numpy.int64)
+            xs = numpy.array([loc[0] for loc in candidates], dtype = numpy.int64)
+            return self._best(shifts, values, ys, xs)
+        return self._scan(lambda ys, xs: self._best(shifts, values, ys, xs))
+
+    def close(self):
+        '''Release any threads held by this backend
+
+        See Backend.close
+        '''
+        if (self.pool != None):
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+    def _scan(self, best):
+        '''Find the best candidate over every shard
+
+        Arguments:
+        best -- function taking arrays of candidate rows and columns, 
+            returning a 2-tuple of the best weight and source pixel 
+            among them
+
+        Returns: 2-tuple of the best weight and the chosen source pixel
+        '''
+        if (self.pool == None):
+            return best(self.ys, self.xs)
+        # lowest of the shard picks, ties broken on pixel value as before
+        return min(self.pool.map(lambda shard: best(*shard), self.shards))
+
+    def _region(self, target, tloc, nearer):
+        '''Collect a target neighbourhood into arrays
+
+        Arguments:
+        target -- target Texture
+        tloc -- 2-tuple location of the pixel in the target
+        nearer -- list of 2-tuple shifts valid about tloc in the target
+
+        Returns: 2-tuple of (n, 2) array of shifts and (n, bpp) array of
+            target pixels at those shifts
+        '''
+        shifts = numpy.array(nearer, dtype = numpy.int64).reshape(-1, 2)
+        values = numpy.array([target.getPixel(tloc, shift)
+                              for shift in nearer],
+                             dtype = numpy.int64).reshape(-1, target.bpp)
+        return (shifts, values)
+
+    def _best(self, shifts, values, ys, xs):
+        '''Find the best of some candidates for a target neighbourhood
+
+        Arguments:
+        shifts, values -- target neighbourhood, as given by _region
+        ys, xs -- arrays of candidate rows and columns
+
+        Returns: 2-tuple of the best weight and the chosen source pixel
+        '''
+        return self._pick(self._weights(shifts, values, ys, xs), ys, xs)
+
+    def _pick(self, weights, ys, xs):
+        '''Pick the best of some scored candidates
+
+        Arguments:
+        weights -- array of candidate weights
+        ys, xs -- arrays of candidate rows and columns
+
+        Returns: 2-tuple of the best weight and the chosen source pixel
+        '''
+        best = weights.min()
+
+        # break ties on pixel value, as the reference sort does
+        tied = numpy.flatnonzero(weights == best)
+        channels = self.pixels[ys[tied], xs[tied]].astype(numpy.int64)
+        order = 256 ** numpy.arange(channels.shape[1] - 1, -1, -1)
+        pick = tied[numpy.argmin(channels.dot(order))]
+
+        pixel = tuple(int(c) for c in self.pixels[ys[pick], xs[pick]])
+        return (float(best), pixel)
+
+    def _weights(self, shifts, values, ys, xs):
+        '''Score candidates against a target neighbourhood
+
+        Arguments:
+        shifts, values -- target neighbourhood, as given by _region
+        ys, xs -- arrays of candidate rows and columns
+
+        Returns: array of weights as given by compareRegion, one for each
+            candidate
+        '''
+        (height, width) = self.valid.shape
+        total = numpy.zeros(len(ys), dtype = numpy.int64)
+        count = numpy.zeros(len(ys), dtype = numpy.int64)
+        for (shift, value) in zip(shifts, values):
+            y = ys + shift[1]
+            x = xs + shift[0]
+            inside = (x >= 0) & (x < width) & (y >= 0) & (y < height)
+            # clamp so outside points can be looked up, then mask them off
+            y = numpy.where(inside, y, 0)
+            x = numpy.where(inside, x, 0)
+            inside &= self.valid[y, x]
+            diff = self.pixels[y, x].astype(numpy.int64) - value
+            total += numpy.where(inside, (diff * diff).sum(axis = 1), 0)
+            count += inside
+
+        # weight by number of points compared, Infinity if none
+        weights = numpy.empty(len(ys))
+        weights.fill(float('inf'))
+        seen = count > 0
+        weights[seen] = total[seen].astype(numpy.float64) / count[seen]
+        return weights
+
+class NumbaBackend(NumpyBackend):
+    '''JIT-compiled matching kernel using Numba.
+
+    Inherits from NumpyBackend, replacing the scoring loop with a compiled
+    one. No new methods or variables.
+    '''
+
+    def _weights(self, shifts, values, ys, xs):
+        '''Score candidates against a target neighbourhood
+
+        See NumpyBackend._weights
+        '''
+        return _numbaWeights(self.pixels, self.valid, shifts, values, ys, xs)
+
+class SlidingBackend(NumpyBackend):
+    '''Vectorised matching kernel reusing column sums along a row.
+
+    Inherits from NumpyBackend. A neighbourhood is split into columns, and
+    the distance sums for each column are kept for every source position
+    in a candidate row. When the target pixel moves one to the right, all
+    but the entering column and the column holding the pixel just written
+    are reused, so each match costs O(radius) rather than O(radius**2) per
+    candidate. Any other move, or a match over given candidates, starts
+    afresh. New column sums are found in one thread; adding them up for
+    each candidate is split into shards as for NumpyBackend.
+
+    The sums cost memory: each kept column holds two 32-bit integers for
+    every position in a candidate row, so up to 8 * (2 * radius + 1) bytes
+    per position in all. For a source too large for that, such as a big
+    MappedTexture, use NumpyBackend, which keeps nothing between matches.
+
+    Class variables:
+    columns -- dictionary of column sums, keyed by target column, target
+        row and tuple of row shifts in the column
+    last -- 2-tuple location of the previous target pixel, or None
+    rows -- sorted array of the source rows holding candidates
+    rowIndex -- array giving the position in rows of each source row, or
+        -1 for a row without candidates
+    '''
+
+    def prepare(self, source, slist):
+        '''Set the source texture and candidate list
+
+        See Backend.prepare
+        '''
+        NumpyBackend.prepare(self, source, slist)
+        self.columns = {}
+        self.last = None
+        # column sums are only kept for rows with candidates
+        self.rows = numpy.unique(self.ys)
+        self.rowIndex = numpy.empty(self.valid.shape[0], dtype = numpy.int64)
+        self.rowIndex.fill(-1)
+        self.rowIndex[self.rows] = numpy.arange(len(self.rows))
+
+    def update(self, loc):
+        '''Note that a source pixel has changed since prepare
+
+        See Backend.update
+        '''
+        NumpyBackend.update(self, loc)
+        # every column sum may include the changed pixel
+        self.columns = {}
+
+    def match(self, target, tloc, nearer, candidates = None):
+        '''Find the best candidate for a target pixel
+
+        See Backend.match
+        '''
+        # column sums cover every candidate; start afresh after this
+        if (candidates != None):
+            self.last = None
+            return NumpyBackend.match(self, target, tloc, nearer, candidates)
+        
+        # only the previous pixel has changed since then, if it was
+        # immediately to the left
+        if (self.last == (tloc[0] - 1, tloc[1])):
+            stale = self.last[0]
+        else:
+            self.columns = {}
+            stale = None
+        self.last = tloc
+
+        # split the neighbourhood into columns
+        shifts = {}
+        for (i, j) in nearer:
+            shifts.setdefault(i, []).append(j)
+
+        # find the column sums, keeping only those used
+        columns = {}
+        used = []
+        for (i, rows) in shifts.items():
+            key = (tloc[0] + i, tloc[1], tuple(rows))
+            if (key in self.columns and key[0] != stale):
+                columns[key] = self.columns[key]
+            else:
+                columns[key] = self._column(target, key)
+            used.append((i, columns[key]))
+        self.columns = columns
+
+        return self._scan(lambda ys, xs: self._slide(used, ys, xs))
+
+    def _slide(self, used, ys, xs):
+        '''Find the best of some candidates from column sums
+
+        Arguments:
+        used -- list of 2-tuples of column shift and column sums, as given
+            by _column
+        ys, xs -- arrays of candidate rows and columns
+
+        Returns: 2-tuple of the best weight and the chosen source pixel
+        '''
+        # add up the column sums for each candidate
+        width = self.valid.shape[1]
+        rows = self.rowIndex[ys]
+        total = numpy.zeros(len(ys), dtype = numpy.int64)
+        count = numpy.zeros(len(ys), dtype = numpy.int64)
+        for (i, (ctotal, ccount)) in used:
+            x = xs + i
+            inside = (x >= 0) & (x < width)
+            x = numpy.where(inside, x, 0)
+            total += numpy.where(inside, ctotal[rows, x], 0)
+            count += numpy.where(inside, ccount[rows, x], 0)
+
+        # weight by number of points compared, Infinity if none
+        weights = numpy.empty(len(ys))
+        weights.fill(float('inf'))
+        seen = count > 0
+        weights[seen] = total[seen].astype(numpy.float64) / count[seen]
+        return self._pick(weights, ys, xs)
+
+    def _column(self, target, key):
+        '''Find the sums for one target column at every candidate row
+
+        Arguments:
+        target -- target Texture
+        key -- 3-tuple of target column, target row and tuple of row
+            shifts, as used in columns
+
+        Returns: 2-tuple of (len(rows), width) arrays of the distance sums
+            and number of points compared, for the column of source
+            pixels about each position in a candidate row
+        '''
+        (column, row, shifts) = key
+        (height, width) = self.valid.shape
+        # a column sum is at most (2 * radius + 1) * bpp * 255**2
+        total = numpy.zeros((len(self.rows), width), dtype = numpy.int32)
+        count = numpy.zeros((len(self.rows), width), dtype = numpy.int32)
+        for j in shifts:
+            value = numpy.array(target.getPixel((column, row + j)),
+                                dtype = numpy.int32)
+            # candidate rows which stay inside the image when shifted by j
+            inside = (self.rows + j >= 0) & (self.rows + j < height)
+            if (not inside.any()): continue
+            ys = self.rows[inside] + j
+            diff = self.pixels[ys].astype(numpy.int32) - value
+            seen = self.valid[ys]
+            total[inside] += numpy.where(
+                seen, (diff * diff).sum(axis = 2, dtype = numpy.int32), 0)
+            count[inside] += seen
+        return (total, count)
+
+if (numba != None):
+    @numba.njit(nogil = True, cache = True)
+    def _numbaWeights(pixels, valid, shifts, values, ys, xs):
+        '''Compiled equivalent of NumpyBackend._weights'''
+        (height, width) = valid.shape
+        weights = numpy.empty(len(ys))
+        for i in range(len(ys)):
+            total = 0
+            count = 0
+            for j in range(len(shifts)):
+                y = ys[i] + shifts[j, 1]
+                x = xs[i] + shifts[j, 0]
+                if (x < 0 or x >= width or y < 0 or y >= height
+                    or not valid[y, x]):
+                    continue
+                for c in range(values.shape[1]):
+                    diff = numpy.int64(pixels[y, x, c]) - values[j, c]
+                    total += diff * diff
+                count += 1
+            if (count == 0):
+                weights[i] = numpy.inf
+            else:
+                weights[i] = numpy.float64(total) / count
+        return weights
+
+class NeighbourhoodIndex:
+    '''Hash index from neighbourhood contents to source pixels.
+
+    Each candidate is filed under the contents of its neighbourhood for a
+    given Shape, with channel values quantised. A target pixel whose
+    neighbourhood quantises the same way is matched against just the
+    candidates filed with it, rather than every candidate, and given the
+    best as a backend would order them, by weight and then pixel value.
+    A quantum of 1 files together only exact (zero-weight) matches, so
+    the lowest pixel value among them is kept up front.
+
+    The best of a bucket is not always the best of the search: the search
+    compares only the shifts valid in the target, so it may also find
+    candidates filed under other keys which tie with or, for a quantum
+    above 1, beat the bucket's best. The index reflects the source as it
+    was when built.
+
+    Methods:
+    lookup -- find the source pixel for a target neighbourhood
+
+    Class variables:
+    source -- the source Texture
+    near -- Shape the index is built for
+    quantum -- step channel values are quantised to
+    table -- dictionary of lists of 2-tuple candidate locations by 
+        neighbourhood key
+    lowest -- dictionary of the lowest source pixel by neighbourhood key,
+        for a quantum of 1 only
+    '''
+
+    def __init__(self, source, slist, near, quantum = 1):
+        '''Constructor
+
+        Arguments:
+        source -- source Texture
+        slist -- list of 2-tuple candidate locations in the source
+        near -- Shape used for comparisons
+        quantum -- step channel values are quantised to (def. 1, exact)
+
+        Preconditions: quantum >= 1
+        '''
+        assert quantum >= 1
+        self.source = source
+        self.near = near
+        self.quantum = quantum
+        self.table = {}
+        self.lowest = {}
+        for sloc in slist:
+            key = self._key(source, sloc)
+            if (key == None): continue
+            self.table.setdefault(key, []).append(sloc)
+            if (quantum == 1):
+                pixel = source.getPixel(sloc)
+                if (key not in self.lowest or pixel < self.lowest[key]):
+                    self.lowest[key] = pixel
+
+    def lookup(self, target, tloc):
+        '''Find the source pixel for a target neighbourhood
+
+        Arguments:
+        target -- target Texture
+        tloc -- 2-tuple location of the pixel in the target
+
+        Returns: tuple containing the channels of the source pixel, or 
+            None if no candidate has the same neighbourhood
+        '''
+        key = self._key(target, tloc)
+        if (key == None or key not in self.table): return None
+        if (self.quantum == 1): return self.lowest[key]
+
+        # near matches; shifts valid in the target are valid in the bucket
+        nearer = target.goodList(tloc, self.near.shift, target.valid)
+        return min((compareRegion(self.source, target, sloc, tloc, nearer),
+                    self.source.getPixel(sloc))
+                   for sloc in self.table[key])[1]
+
+    def _key(self, tex, loc):
+        '''Find the key for a neighbourhood
+
+        Arguments:
+        tex -- Texture holding the neighbourhood
+        loc -- 2-tuple location of its centre
+
+        Returns: tuple of quantised pixels, or None where a shift is 
+            outside the texture or uninitialised; None if every shift is
+        '''
+        good = set(tex.goodList(loc, self.near.shift, tex.valid))
+        if (len(good) == 0): return None
+        return tuple(tuple(c // self.quantum for c in tex.getPixel(loc, shift))
+                     if shift in good else None
+                     for shift in self.near.shift)
+
+register("python", PythonBackend)
+if (numpy != None):
+    register("numpy", NumpyBackend)
+    register("sliding", SlidingBackend)
+if (numba != None):
+    register("numba", NumbaBackend)
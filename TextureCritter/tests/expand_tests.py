@@ -19,9 +19,10 @@ TextureCritter as the working directory in order for the image paths to
 work correctly.
 '''
 
-from expand import compare
-from texture import Texture, SquareShape
-from PIL import Image
+from expand import compare, expand, inpaint, onionOrder
+from texture import Texture, EmptyTexture, SquareShape, EllShape
+from PIL import Image, ImageDraw
+import threading
 
 class TestExpandMethods:
     '''Tests for Expand methods'''
@@ -58,4 +59,86 @@ class TestExpandMethods:
                  ]
         for c in cases:
             # threshold test for floating point roundoff
-            assert(abs(compare(c[0], c[1]) - c[2]) < 1e-8)
\ No newline at end of file
+            assert(abs(compare(c[0], c[1]) - c[2]) < 1e-8)
+
+class TestInpaint:
+    '''Tests for hole filling'''
+    def setUp(self):
+        '''Setup - crop a small Texture and mask a block in its middle'''
+        self.image = Image.open("tests/gradient.png").crop((110, 80, 122, 90))
+        self.mask = Image.new("L", self.image.size)
+        ImageDraw.Draw(self.mask).rectangle((4, 3, 7, 6), fill = 255)
+        self.hole = {(x,y) for x in range(4, 8) for y in range(3, 7)}
+        
+    def tearDown(self):
+        '''Teardown'''
+        del self.image, self.mask
+        
+    def testOnionOrder(self):
+        '''Test that holes are ordered from the boundary inward'''
+        tex = Texture(self.image)
+        for loc in self.hole:
+            tex.setInvalid(loc)
+        order = onionOrder(tex)
+        assert len(order) == len(self.hole)
+        assert set(order) == self.hole
+        # outer ring of the 4x4 block first, then the 2x2 core
+        core = {(5,4), (6,4), (5,5), (6,5)}
+        assert set(order[:12]) == self.hole - core
+        assert set(order[12:]) == core
+        
+    def testOnionOrderEmpty(self):
+        '''Test that a fully valid texture has nothing to order'''
+        assert onionOrder(Texture(self.image)) == []
+        
+    def testInpaint(self):
+        '''Test that only masked pixels are filled, and all become valid'''
+        tex = Texture(self.image)
+        result = inpaint(tex, self.mask, SquareShape(1))
+        assert result.size == self.image.size
+        assert all(tex.valid)
+        for y in range(self.image.size[1]):
+            for x in range(self.image.size[0]):
+                if (x,y) not in self.hole:
+                    assert result.getpixel((x,y)) == self.image.getpixel((x,y))
+
+class TestTimeLimits:
+    '''Tests for deadlines, cancellation and the engine report'''
+    def setUp(self):
+        '''Setup - crop a small source and an empty target'''
+        self.source = Texture(
+            Image.open("tests/gradient.png").crop((120, 88, 126, 93)))
+        self.target = EmptyTexture((5, 4), "RGB")
+        self.shape = EllShape(1)
+        self.report = {}
+        
+    def tearDown(self):
+        '''Teardown'''
+        del self.source, self.target, self.report
+        
+    def testReport(self):
+        '''Test that an unlimited expansion searches every pixel'''
+        expand(self.source, self.target, self.shape, report = self.report)
+        assert self.report["search"][0] == 20
+        assert self.report["sample"][0] == 0
+        assert self.report["skipped"] == 0
+        assert self.report["search"][1] >= 0
+        
+    def testDeadline(self):
+        '''Test that pixels after the deadline are sampled'''
+        result = expand(self.source, self.target, self.shape, deadline = 0, 
+                        sample = 4, report = self.report)
+        assert result.size == (5, 4)
+        assert all(self.target.valid)
+        assert self.report["search"][0] == 0
+        assert self.report["sample"][0] == 20
+        
+    def testCancel(self):
+        '''Test that a cancelled expansion stops, keeping what is done'''
+        cancel = threading.Event()
+        cancel.set()
+        result = expand(self.source, self.target, self.shape, 
+                        cancel = cancel, report = self.report)
+        assert result.size == (5, 4)
+        assert not any(self.target.valid)
+        assert self.report["skipped"] == 20
@@ -0,0 +1,242 @@
+# Copyright 2015 Myriam Johnson
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#     http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''Tests for module kernels.py
+
+Tests are written for the nose framework and should be run with
+TextureCritter as the working directory in order for the image paths to
+work correctly.
+'''
+
+from kernels import available, getBackend, PythonBackend, NeighbourhoodIndex
+from expand import expand, inpaint
+from texture import (Texture, EmptyTexture, MappedTexture, SquareShape, 
+                     EllShape)
+from PIL import Image, ImageDraw
+from random import Random
+import os
+import shutil
+import tempfile
+
+def test_registry():
+    '''Test that the reference backend is always registered'''
+    assert "python" in available()
+    assert isinstance(getBackend("python"), PythonBackend)
+
+def test_registry_unknown():
+    '''Test that an unknown backend name raises ValueError'''
+    try:
+        getBackend("no such backend")
+    except ValueError:
+        pass
+    else:
+        assert False
+
+class TestConformance:
+    '''Tests that every available backend picks the same pixels'''
+    def setUp(self):
+        '''Setup - crop small source and target images
+
+        Crops are kept small so the reference backend runs quickly.
+        '''
+        gradient = Image.open("tests/gradient.png")
+        colour = Image.open("tests/colourpng.png")
+        self.sources = [gradient.crop((120, 88, 130, 96)),
+                        colour.crop((0, 0, 10, 8))]
+        self.targets = [gradient.crop((20, 30, 27, 35)),
+                        colour.crop((30, 20, 37, 25))]
+
+    def tearDown(self):
+        '''Teardown'''
+        del self.sources, self.targets
+
+    def _expansions(self, make, threads = 1):
+        '''Expand with every backend and check the results agree
+
+        Arguments:
+        make -- function taking a source image and its index, returning
+            a 2-tuple of target Texture and Shape
+        threads -- number of threads to scan candidates with (def. 1)
+        '''
+        for (i, image) in enumerate(self.sources):
+            results = {}
+            for name in available():
+                (target, shape) = make(image, i)
+                results[name] = expand(Texture(image), target, shape,
+                                       name, threads = threads).tobytes()
+            for name in available():
+                assert results[name] == results["python"], name
+
+    def testTargeted(self):
+        '''Test targeted expansion with a SquareShape'''
+        self._expansions(lambda image, i:
+                         (Texture(self.targets[i].convert(image.mode)),
+                          SquareShape(2)))
+
+    def testThreaded(self):
+        '''Test targeted expansion with candidates split across threads'''
+        self._expansions(lambda image, i:
+                         (Texture(self.targets[i].convert(image.mode)),
+                          SquareShape(2)), 3)
+
+    def testUntargeted(self):
+        '''Test untargeted expansion with an EllShape'''
+        self._expansions(lambda image, i:
+                         (EmptyTexture((8, 6), image.mode), EllShape(2)))
+
+    def testCandidates(self):
+        '''Test expansion from some rows and columns of the source only'''
+        for image in self.sources:
+            slist = [(x,y) for y in range(1, image.size[1], 3)
+                     for x in range(0, image.size[0], 2)]
+            results = {}
+            for name in available():
+                results[name] = expand(Texture(image),
+                                       EmptyTexture((8, 6), image.mode),
+                                       EllShape(2), name, slist).tobytes()
+            for name in available():
+                assert results[name] == results["python"], name
+
+    def testSlidingRows(self):
+        '''Test that column sums are only kept for candidate rows'''
+        if ("sliding" not in available()): return
+        image = self.sources[0]
+        source = Texture(image)
+        target = EmptyTexture((8, 6), image.mode)
+        target.setPixel(source.getPixel((0,0)), (0,0))
+        target.setValid((0,0))
+        backend = getBackend("sliding")
+        backend.prepare(source, [(x,y) for y in (2, 5) 
+                                 for x in range(image.size[0])])
+        backend.match(target, (1,0), [(-1,0)])
+        for (total, count) in backend.columns.values():
+            assert total.shape == (2, image.size[0])
+            assert count.shape == (2, image.size[0])
+
+    def testInpaint(self):
+        '''Test hole filling, where the source changes as it is filled'''
+        mask = Image.new("L", self.sources[0].size)
+        ImageDraw.Draw(mask).rectangle((3, 2, 6, 5), fill = 255)
+        for image in self.sources:
+            results = {}
+            for name in available():
+                results[name] = inpaint(Texture(image), mask, SquareShape(2),
+                                        name).tobytes()
+            for name in available():
+                assert results[name] == results["python"], name
+
+    def testMapped(self):
+        '''Test expansion and hole filling from a MappedTexture'''
+        scratch = tempfile.mkdtemp()
+        path = os.path.join(scratch, "source.map")
+        mask = Image.new("L", self.sources[0].size)
+        ImageDraw.Draw(mask).rectangle((3, 2, 6, 5), fill = 255)
+        try:
+            for image in self.sources:
+                expected = expand(Texture(image), 
+                                  EmptyTexture((8, 6), image.mode), 
+                                  EllShape(2)).tobytes()
+                filled = inpaint(Texture(image), mask, 
+                                 SquareShape(2)).tobytes()
+                for name in available():
+                    source = MappedTexture(path, image)
+                    result = expand(source, EmptyTexture((8, 6), image.mode),
+                                    EllShape(2), name).tobytes()
+                    source.close()
+                    assert result == expected, name
+                    source = MappedTexture(path, image, readonly = False)
+                    result = inpaint(source, mask, SquareShape(2), 
+                                     name).tobytes()
+                    source.close()
+                    assert result == filled, name
+        finally:
+            shutil.rmtree(scratch)
+
+    def testMappedView(self):
+        '''Test that NumPy backends view a mapped source without copying'''
+        if ("numpy" not in available()): return
+        scratch = tempfile.mkdtemp()
+        try:
+            source = MappedTexture(os.path.join(scratch, "source.map"), 
+                                   self.sources[0])
+            backend = getBackend("numpy")
+            backend.prepare(source, [(0,0)])
+            assert not backend.pixels.flags.owndata
+            assert not backend.valid.flags.owndata
+            assert (tuple(backend.pixels[3, 2]) == source.getPixel((2,3)))
+            del backend
+            source.close()
+        finally:
+            shutil.rmtree(scratch)
+
+class TestNeighbourhoodIndex:
+    '''Tests for the exact-match index'''
+    def setUp(self):
+        '''Setup - tile a 4x4 pattern of random colours into a (12,12)
+        source; colours are multiples of 8 for the quantised tests
+        '''
+        rng = Random(1)
+        pattern = [tuple(rng.randrange(0, 256, 8) for _ in range(3))
+                   for _ in range(16)]
+        self.image = Image.new("RGB", (12, 12))
+        self.image.putdata([pattern[(y % 4) * 4 + x % 4]
+                            for y in range(12) for x in range(12)])
+        self.source = Texture(self.image)
+        self.slist = [(x,y) for y in range(12) for x in range(12)]
+
+    def tearDown(self):
+        '''Teardown'''
+        del self.image, self.source
+
+    def testLookup(self):
+        '''Test that a repeated neighbourhood finds its centre pixel'''
+        index = NeighbourhoodIndex(self.source, self.slist, EllShape(2))
+        for loc in [(2,2), (5,7), (11,11)]:
+            assert index.lookup(self.source, loc) == self.source.getPixel(loc)
+
+    def testMiss(self):
+        '''Test that an unknown or empty neighbourhood finds nothing'''
+        index = NeighbourhoodIndex(self.source, self.slist, EllShape(2))
+        assert index.lookup(EmptyTexture((12, 12), "RGB"), (5,5)) == None
+        shifted = Texture(self.image.point(lambda c: c + 3))
+        assert index.lookup(shifted, (5,5)) == None
+
+    def testQuantised(self):
+        '''Test that a coarser quantum finds near matches'''
+        index = NeighbourhoodIndex(self.source, self.slist, EllShape(2), 8)
+        shifted = Texture(self.image.point(lambda c: c + 3))
+        assert index.lookup(shifted, (5,5)) == self.source.getPixel((5,5))
+
+    def testNearest(self):
+        '''Test that a coarser quantum picks the closest in its bucket'''
+        image = Image.new("RGB", (4, 1))
+        image.putdata([(7,7,7), (200,200,200), (0,0,0), (50,50,50)])
+        source = Texture(image)
+        index = NeighbourhoodIndex(source, [(1,0), (3,0)], EllShape(1), 8)
+        assert index.lookup(source, (1,0)) == (200,200,200)
+        assert index.lookup(source, (3,0)) == (50,50,50)
+
+    def testExpansion(self):
+        '''Test that using the index leaves a periodic expansion unchanged
+
+        Every exact match in a periodic source has the same centre pixel,
+        so here the index and the search cannot pick differently; that
+        does not hold for sources in general.
+        '''
+        for name in available():
+            plain = expand(self.source, EmptyTexture((16, 16), "RGB"),
+                           EllShape(2), name)
+            indexed = expand(self.source, EmptyTexture((16, 16), "RGB"),
+                             EllShape(2), name, quantum = 1)
+            assert plain.tobytes() == indexed.tobytes(), name
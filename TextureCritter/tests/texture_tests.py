@@ -21,6 +21,9 @@ work correctly.
 
 from texture import *
 from random import randrange
+import os
+import shutil
+import tempfile
 
 # using sets to test because order does not matter
 
@@ -263,4 +266,96 @@ class TestTexMethods:
             x = randrange(self.texture.pic.size[0])
             y = randrange(self.texture.pic.size[1])
             assert (self.texture.getPixel((x,y)) == result.getpixel((x,y)))                     
-        
\ No newline at end of file
+        
+class TestMappedTexture:
+    '''Tests for MappedTexture and MappedEmptyTexture'''
+    def setUp(self):
+        '''Setup - create a MappedTexture from gradient.png in a scratch
+        directory, and an in-memory Texture for reference
+        '''
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "gradient.map")
+        self.reference = Texture(Image.open("tests/gradient.png"))
+        self.texture = MappedTexture(self.path, 
+                                     Image.open("tests/gradient.png"))
+    
+    def tearDown(self):
+        '''Teardown'''
+        self.texture.close()
+        shutil.rmtree(self.dir)
+        del self.texture, self.reference
+        
+    def testCreation(self):
+        '''Test that mapped texture matches the in-memory texture'''
+        assert self.texture.pic.size == self.reference.pic.size
+        assert self.texture.pic.mode == self.reference.pic.mode
+        assert self.texture.bpp == self.reference.bpp
+        assert len(self.texture.pixels) == len(self.reference.pixels)
+        assert list(self.texture.pixels) == self.reference.pixels
+        assert all(self.texture.valid)
+        for _ in xrange(100):
+            x = randrange(self.texture.pic.size[0])
+            y = randrange(self.texture.pic.size[1])
+            assert (self.texture.getPixel((x,y)) == 
+                    self.reference.getPixel((x,y)))
+            assert self.texture.valid[self.texture._index((x,y))]
+            
+    def testWriteThrough(self):
+        '''Test that writes reach the map file and are seen by readers'''
+        writer = MappedTexture(self.path, readonly = False)
+        value = tuple([randrange(255) for _ in xrange(writer.bpp)])
+        writer.setPixel(value, (3,4))
+        writer.flush()
+        assert self.texture.getPixel((3,4)) == value
+        writer.close()
+        reopened = MappedTexture(self.path)
+        assert reopened.getPixel((3,4)) == value
+        reopened.close()
+        
+    def testToImage(self):
+        '''Test Image output function'''
+        result = self.texture.toImage()
+        assert result.size == self.reference.pic.size
+        assert result.tobytes() == self.reference.toImage().tobytes()
+        
+    def testEmpty(self):
+        '''Test that a mapped empty texture starts blank and uninitialised'''
+        empty = MappedEmptyTexture(os.path.join(self.dir, "empty.map"),
+                                   (7,5), "RGBA")
+        assert empty.pic.mode == "RGBA"
+        assert empty.bpp == 4
+        assert len(empty.pixels) == 7*5
+        assert not any(empty.valid[i] for i in xrange(7*5))
+        assert empty.getPixel((6,4)) == (0, 0, 0, 0)
+        empty.setValid((6,4))
+        assert empty.valid[empty._index((6,4))]
+        assert empty.goodList((6,3), [(0,1), (0,0)], empty.valid) == [(0,1)]
+        empty.close()
+        
+    def testOutOfRange(self):
+        '''Test that indices outside the texture raise IndexError'''
+        writer = MappedTexture(self.path, readonly = False)
+        count = len(writer.pixels)
+        for index in [-1, count]:
+            for access in [lambda: writer.pixels[index],
+                           lambda: writer.valid[index],
+                           lambda: writer.pixels.__setitem__(index, (1,2,3)),
+                           lambda: writer.valid.__setitem__(index, False)]:
+                try:
+                    access()
+                except IndexError:
+                    pass
+                else:
+                    assert False
+        # nothing leaked into the validity flags
+        assert all(writer.valid)
+        writer.close()
+        
+    def testBadFile(self):
+        '''Test that opening a file which is not a map raises IOError'''
+        try:
+            MappedTexture("tests/gradient.png")
+        except IOError:
+            pass
+        else:
+            assert False
@@ -0,0 +1,129 @@
+# Copyright 2015 Myriam Johnson
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#     http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''Tests for module tiles.py
+
+Tests are written for the nose framework and should be run with
+TextureCritter as the working directory in order for the image paths to
+work correctly.
+'''
+
+from tiles import plan, work, stitch
+from texture import Texture
+from PIL import Image
+import json
+import os
+import shutil
+import tempfile
+
+class TestTiles:
+    '''Tests for tiled expansion'''
+    def setUp(self):
+        '''Setup - a scratch work directory and small source and target
+
+        The untargeted plan expands a (6,5) source to (12,10), in tiles of
+        edge 8 overlapping by 4, giving a 2x2 grid.
+        '''
+        self.dir = tempfile.mkdtemp()
+        gradient = Image.open("tests/gradient.png")
+        self.source = gradient.crop((120, 88, 126, 93))
+        self.target = gradient.crop((20, 30, 30, 36))
+
+    def tearDown(self):
+        '''Teardown'''
+        shutil.rmtree(self.dir)
+        del self.source, self.target
+
+    def testPlan(self):
+        '''Test that tiles overlap and cover the whole target'''
+        assert plan(self.dir, self.source, tile = 8, overlap = 4) == 4
+        with open(os.path.join(self.dir, "plan.json")) as planfile:
+            settings = json.load(planfile)
+        assert settings["size"] == [12, 10]
+        assert settings["columns"] == 2
+        assert settings["tiles"] == [[0, 0, 8, 8], [4, 0, 12, 8],
+                                     [0, 4, 8, 10], [4, 4, 12, 10]]
+
+    def testWorkAndStitch(self):
+        '''Test that workers expand each tile once and stitching fills it'''
+        count = plan(self.dir, self.source, self.target, tile = 6,
+                     overlap = 2, nsize = 1)
+        assert work(self.dir, [0]) == 1
+        assert work(self.dir) == count - 1
+        assert work(self.dir) == 0
+        result = stitch(self.dir)
+        assert result.size == self.target.size
+        assert result.mode == "RGB"
+
+        # away from overlaps, the result is the tile as expanded
+        first = Image.open(os.path.join(self.dir, "tile_0.png"))
+        for y in range(4):
+            for x in range(4):
+                assert result.getpixel((x,y)) == first.getpixel((x,y))
+
+    def testUntargeted(self):
+        '''Test that untargeted tiles continue from their neighbours'''
+        count = plan(self.dir, self.source, tile = 8, overlap = 4, nsize = 1)
+        assert work(self.dir) == count
+        result = stitch(self.dir)
+        assert result.size == (12, 10)
+
+        # tiles differ, but agree with the stitched result everywhere
+        tiles = [Image.open(os.path.join(self.dir, "tile_%d.png" % n))
+                 for n in range(count)]
+        assert tiles[0].tobytes() != tiles[1].tobytes()
+        assert tiles[0].tobytes() != tiles[2].tobytes()
+        with open(os.path.join(self.dir, "plan.json")) as planfile:
+            boxes = json.load(planfile)["tiles"]
+        for (tile, box) in zip(tiles, boxes):
+            assert result.crop(tuple(box)).tobytes() == tile.tobytes()
+
+        # and every pixel comes from the source
+        colours = set(Texture(self.source).pixels)
+        assert set(Texture(result).pixels) <= colours
+
+    def testWaiting(self):
+        '''Test that untargeted tiles wait for claimed neighbours'''
+        plan(self.dir, self.source, tile = 8, overlap = 4, nsize = 1)
+        open(os.path.join(self.dir, "tile_0.lock"), "w").close()
+        assert work(self.dir, wait = 0) == 0
+        os.remove(os.path.join(self.dir, "tile_0.lock"))
+        assert work(self.dir, [1, 2, 3]) == 0
+        assert work(self.dir, [0, 1]) == 2
+
+    def testFailed(self):
+        '''Test that a tile which fails to expand is given back'''
+        plan(self.dir, self.source, tile = 8, overlap = 4, nsize = 1)
+        try:
+            work(self.dir, backend = "no such backend")
+        except ValueError:
+            pass
+        else:
+            assert False
+        assert sorted(os.listdir(self.dir)) == ["plan.json", "source.map"]
+        assert work(self.dir, wait = 0) == 4
+
+    def testClaimed(self):
+        '''Test that a tile claimed by another worker is skipped'''
+        count = plan(self.dir, self.source, self.target, tile = 6,
+                     overlap = 2, nsize = 1)
+        open(os.path.join(self.dir, "tile_0.lock"), "w").close()
+        assert work(self.dir) == count - 1
+        assert not os.path.exists(os.path.join(self.dir, "tile_0.png"))
+        try:
+            stitch(self.dir)
+        except IOError:
+            pass
+        else:
+            assert False
@@ -17,6 +17,10 @@
 class Texture -- provides functions for working with a base PIL.Image
 class EmptyTexture (subclasses Texture) -- a Texture variation that starts
     empty, with all pixels marked as uninitialised
+class MappedTexture (subclasses Texture) -- a Texture variation keeping its
+    pixel and validity data in a memory-mapped file
+class MappedEmptyTexture (subclasses MappedTexture) -- a MappedTexture
+    variation that starts empty, with all pixels marked as uninitialised
 
 class Shape -- generic base class to define the sampling shape for texture 
     region comparison
@@ -27,6 +31,8 @@ class EllShape (subclasses Shape) -- defines an L-shaped Shape (rows above
 
 from PIL import Image
 import itertools
+import mmap
+import struct
 
 class Texture:
     '''A texture synthesis object
@@ -37,6 +43,7 @@ class Texture:
     getPixel -- get the pixel at a given location
     setPixel -- set the pixel at given location to given value
     setValid -- set the pixel at given location as valid
+    setInvalid -- set the pixel at given location as invalid
     toImage -- output this Texture as an Image
     
     Class variables:
@@ -177,6 +184,17 @@ class Texture:
         Postcondition: valid flag for pixel at loc is set to 1 
         '''
         self.valid[self._index(loc)] = True
+        
+    def setInvalid(self, loc):
+        '''Clear valid flag for pixel at a given location
+        
+        Arguments:
+        loc -- 2-tuple pixel location
+        
+        Preconditions: loc is inside the image
+        Postcondition: valid flag for pixel at loc is set to 0 
+        '''
+        self.valid[self._index(loc)] = False
     
     def toImage(self):
         '''Output this texture data into an Image
@@ -223,6 +241,245 @@ class EmptyTexture(Texture):
         self.pixels = [colour] * size[0] * size[1]
         self.valid = [False] * (size[0] * size[1])
 
+class MappedTexture(Texture):
+    '''Texture synthesis object backed by a memory-mapped file.
+    
+    Inherits from Texture. Pixel and validity data live in a raw map file
+    rather than in lists, so the texture may be larger than memory and a
+    single file may be opened read-only by many processes at once. Changes
+    made with setPixel and setValid are written straight into the mapping.
+    
+    The map file holds a header (magic, width, height, bpp), then the pixel
+    bytes in row order, then one validity byte per pixel.
+    
+    New methods:
+    flush -- write outstanding changes back to the map file
+    close -- flush and release the map file
+    
+    New class variables:
+    header -- struct format of the map file header
+    magic -- identifying string at the start of a map file
+    path -- name of the map file
+    readonly -- whether the map file was opened read-only
+    '''
+    
+    header = "<8sIII"
+    magic = b"TCMAP001"
+    
+    def __init__(self, path, image = None, readonly = True):
+        '''Constructor
+        
+        Opens the map file at path. If an image is given, the map file is
+        first (re)written from it, converted to RGB(A) mode with all pixels
+        valid.
+        
+        Arguments:
+        path -- name of the map file
+        image -- Image to write into the map file (def. None, open the 
+            existing file)
+        readonly -- whether to open the map file read-only (def. True)
+        '''
+        if (image != None):
+            if (image.mode in Texture.alpha_modes):
+                image = image.convert("RGBA")
+                bpp = 4
+            else:
+                image = image.convert("RGB")
+                bpp = 3
+            self._create(path, image.size, bpp, image.tobytes())
+        self._open(path, readonly)
+        
+    def _create(self, path, size, bpp, data = None):
+        '''Write a new map file
+        
+        Arguments:
+        path -- name of the map file
+        size -- 2-tuple (width, height) size of the texture
+        bpp -- number of channels for each pixel, 3 or 4
+        data -- bytes of pixel data, all valid (def. None, leave every 
+            pixel blank and uninitialised)
+        
+        Preconditions: data, if given, holds size[0] * size[1] * bpp bytes
+        '''
+        count = size[0] * size[1]
+        with open(path, "wb") as mapfile:
+            mapfile.write(struct.pack(self.header, self.magic, 
+                                      size[0], size[1], bpp))
+            if (data == None):
+                # extend with zeroes; sparse where the filesystem allows
+                mapfile.seek(count * (bpp + 1) - 1, 1)
+                mapfile.write(b"\0")
+            else:
+                assert len(data) == count * bpp
+                mapfile.write(data)
+                # validity a row at a time, to keep memory use down
+                row = b"\1" * size[0]
+                for _ in range(size[1]):
+                    mapfile.write(row)
+                    
+    def _open(self, path, readonly):
+        '''Map an existing map file into this texture
+        
+        Arguments:
+        path -- name of the map file
+        readonly -- whether to open the map file read-only
+        
+        Raises: IOError if the file is not a texture map file
+        '''
+        self.path = path
+        self.readonly = readonly
+        self._file = open(path, "rb" if readonly else "r+b")
+        start = struct.calcsize(self.header)
+        (magic, width, height, self.bpp) = struct.unpack(
+            self.header, self._file.read(start))
+        if (magic != self.magic):
+            self._file.close()
+            raise IOError("Not a texture map file: " + path)
+        access = mmap.ACCESS_READ if readonly else mmap.ACCESS_WRITE
+        self._map = mmap.mmap(self._file.fileno(), 0, access = access)
+        
+        count = width * height
+        mode = "RGBA" if self.bpp == 4 else "RGB"
+        self.pic = _MappedImage((width, height), mode)
+        self.pixels = _MappedPixels(self._map, start, count, self.bpp)
+        self.valid = _MappedValid(self._map, start + count * self.bpp, count)
+        
+    def flush(self):
+        '''Write outstanding changes back to the map file'''
+        if (not self.readonly):
+            self._map.flush()
+        
+    def close(self):
+        '''Flush and release the map file
+        
+        Postconditions: this texture can no longer be used
+        '''
+        self.flush()
+        self._map.close()
+        self._file.close()
+        
+    def toImage(self):
+        '''Output this texture data into an Image
+        
+        Returns: an Image in RGB(A) mode containing this texture's data
+        '''
+        start = self.pixels.offset
+        end = start + len(self.pixels) * self.bpp
+        return Image.frombytes(self.pic.mode, self.pic.size, 
+                               self._map[start:end])
+        
+class MappedEmptyTexture(MappedTexture):
+    '''Empty memory-mapped texture synthesis object for untargeted synthesis.
+    
+    Inherits from MappedTexture. No new methods or variables.
+    '''
+    
+    def __init__(self, path, size, mode):
+        '''Constructor
+        
+        Creates this MappedEmptyTexture with a new writable map file, with
+        every pixel blank and uninitialised.
+        
+        Arguments:
+        path -- name of the map file
+        size -- 2-tuple (width, height) size for the Texture
+        mode -- string mode of the new Texture; alpha modes give RGBA, 
+            anything else RGB
+        '''
+        bpp = 4 if mode in Texture.alpha_modes else 3
+        self._create(path, size, bpp)
+        self._open(path, False)
+
+class _MappedImage:
+    '''Stand-in for the Image of a MappedTexture, giving only its size and
+    mode so that the full image is never held in memory.
+    '''
+    
+    def __init__(self, size, mode):
+        '''Constructor
+        
+        Arguments:
+        size -- 2-tuple (width, height) size of the texture
+        mode -- string mode of the texture, RGB or RGBA
+        '''
+        self.size = size
+        self.mode = mode
+
+class _MappedPixels:
+    '''List-like view of the pixels in a map file, as bpp-tuples'''
+    
+    def __init__(self, mapping, offset, count, bpp):
+        '''Constructor
+        
+        Arguments:
+        mapping -- mmap of the map file
+        offset -- byte offset of the first pixel
+        count -- number of pixels
+        bpp -- number of bytes per pixel
+        '''
+        self.mapping = mapping
+        self.offset = offset
+        self.count = count
+        self.bpp = bpp
+        
+    def __len__(self):
+        return self.count
+    
+    def __getitem__(self, index):
+        _checkIndex(index, self.count)
+        start = self.offset + index * self.bpp
+        return tuple(bytearray(self.mapping[start:start + self.bpp]))
+    
+    def __setitem__(self, index, value):
+        _checkIndex(index, self.count)
+        assert len(value) == self.bpp
+        start = self.offset + index * self.bpp
+        self.mapping[start:start + self.bpp] = bytes(bytearray(value))
+        
+class _MappedValid:
+    '''List-like view of the validity flags in a map file, as booleans'''
+    
+    def __init__(self, mapping, offset, count):
+        '''Constructor
+        
+        Arguments:
+        mapping -- mmap of the map file
+        offset -- byte offset of the first flag
+        count -- number of flags
+        '''
+        self.mapping = mapping
+        self.offset = offset
+        self.count = count
+        
+    def __len__(self):
+        return self.count
+        
+    def __getitem__(self, index):
+        _checkIndex(index, self.count)
+        start = self.offset + index
+        return self.mapping[start:start + 1] != b"\0"
+    
+    def __setitem__(self, index, value):
+        _checkIndex(index, self.count)
+        start = self.offset + index
+        self.mapping[start:start + 1] = b"\1" if value else b"\0"
+
+def _checkIndex(index, count):
+    '''Check an index into a mapped view
+    
+    Negative indices are refused rather than counted from the end, as they
+    only arise from locations outside the texture. Raising IndexError past
+    the end also lets the views be iterated like lists.
+    
+    Arguments:
+    index -- integer index
+    count -- number of items in the view
+    
+    Raises: IndexError if index is not in 0 to count - 1
+    '''
+    if (index < 0 or index >= count):
+        raise IndexError("mapped texture index out of range: %d" % index)
+
 class Shape:
     '''Defines a region for texture comparison.
         
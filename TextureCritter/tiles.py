@@ -0,0 +1,429 @@
+# Copyright 2015 Myriam Johnson
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#     http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''Tiled texture expansion across processes or machines.
+
+A large target is split into overlapping tiles, each expanded as a job of
+its own. Jobs share nothing but files in a work directory, so any number
+of worker processes, on one machine or many with a shared filesystem, can
+run them. Once every tile is done they are stitched together.
+
+Targeted tiles are independent, and their overlaps are blended. An
+untargeted tile instead starts from the pixels it shares with finished
+tiles before it, and continues the texture out from them, so it waits for
+those tiles and its overlaps agree with theirs.
+
+Methods:
+plan -- write the tiles for an expansion into a work directory
+work -- expand unclaimed tiles from a work directory
+stitch -- blend the finished tiles into the final image
+
+Work directory contents:
+plan.json -- expansion settings and tile boxes
+source.map -- the source, as a MappedTexture shared by all workers
+target.png -- the target, for targeted expansion only
+tile_<n>.png -- finished tile n
+tile_<n>.lock -- claim on tile n by a worker; remove a stale one to retry
+
+Author: mym
+'''
+
+from __future__ import print_function
+import texture
+from expand import expand
+from PIL import Image
+import errno
+import json
+import os
+import time
+
+def plan(directory, source_image, target_image = None, scale = 2,
+         tile = 64, overlap = 8, nsize = 2):
+    '''Write the tiles for an expansion into a work directory
+
+    Arguments:
+    directory -- existing work directory
+    source_image -- Image to be expanded
+    target_image -- Image to guide expansion (def. None, untargeted)
+    scale -- scale factor for untargeted expansion (def. 2)
+    tile -- edge length of each tile, in pixels (def. 64)
+    overlap -- pixels shared by neighbouring tiles (def. 8)
+    nsize -- size of neighbourhood used in comparisons (def. 2)
+
+    Returns: number of tiles
+
+    Preconditions: 0 <= overlap < tile
+    '''
+    assert 0 <= overlap < tile
+
+    # source is shared, read-only, by every worker
+    source = texture.MappedTexture(os.path.join(directory, "source.map"),
+                                   source_image)
+    source.close()
+
+    if (target_image != None):
+        target_image.save(os.path.join(directory, "target.png"))
+        size = target_image.size
+    else:
+        size = (scale * source_image.size[0], scale * source_image.size[1])
+
+    # tile starts along each axis, the last reaching the edge
+    starts = []
+    for length in size:
+        axis = [0]
+        while (axis[-1] + tile < length):
+            axis.append(axis[-1] + tile - overlap)
+        starts.append(axis)
+    boxes = [(left, top, min(left + tile, size[0]), min(top + tile, size[1]))
+             for top in starts[1]
+             for left in starts[0]]
+
+    settings = {"size": size,
+                "columns": len(starts[0]),
+                "targeted": target_image != None,
+                "nsize": nsize,
+                "tiles": boxes}
+    with open(os.path.join(directory, "plan.json"), "w") as planfile:
+        json.dump(settings, planfile)
+    return len(boxes)
+
+def work(directory, tiles = None, backend = "python", threads = 1,
+         wait = None, poll = 1.0):
+    '''Expand unclaimed tiles from a work directory
+
+    A tile is claimed by creating its lock file, which fails if another
+    worker already has it, and finished by renaming its image into place.
+    If expanding a tile fails, or is interrupted, its lock is removed
+    before the error is raised again, so the tile can be retried.
+
+    An untargeted tile is only claimed once every tile before it that it
+    overlaps is finished. While one of those is claimed by another worker,
+    this call waits for it; a tile whose neighbours nobody has claimed is
+    left for a later call.
+
+    Arguments:
+    directory -- work directory written by plan
+    tiles -- list of tile numbers to try (def. None, every tile)
+    backend -- name of the kernels backend used for matching
+        (def. "python")
+    threads -- number of threads each pixel's candidates are scanned with
+        (def. 1)
+    wait -- seconds to wait for neighbours claimed by other workers
+        (def. None, until they finish)
+    poll -- seconds between checks while waiting (def. 1.0)
+
+    Returns: number of tiles expanded by this call
+    '''
+    settings = _settings(directory)
+    boxes = settings["tiles"]
+    if (tiles == None):
+        tiles = range(len(boxes))
+    source = texture.MappedTexture(os.path.join(directory, "source.map"))
+
+    # neighbours always come first, so one pass in order finds every
+    # tile this worker can do without waiting
+    pending = sorted(tiles)
+    done = 0
+    waited = 0.0
+    while (pending):
+        progress = False
+        blocked = False
+        for n in list(pending):
+            name = _tileName(directory, n)
+            if (os.path.exists(name + ".png")):
+                pending.remove(n)
+                continue
+
+            # unfinished neighbours, for untargeted tiles only
+            if (settings["targeted"]):
+                missing = []
+            else:
+                missing = [m for m in _neighbours(boxes, n)
+                           if not os.path.exists(_tileName(directory, m)
+                                                 + ".png")]
+            if (missing):
+                if (any(m in pending or 
+                        os.path.exists(_tileName(directory, m) + ".lock")
+                        for m in missing)):
+                    blocked = True
+                else:
+                    pending.remove(n)
+                continue
+
+            try:
+                claim = os.open(name + ".lock",
+                                os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except OSError as e:
+                if (e.errno != errno.EEXIST): raise
+                pending.remove(n)
+                continue
+            os.close(claim)
+
+            # give the tile back if it fails, even on an interrupt, so
+            # workers waiting on it are not stalled
+            try:
+                _expandTile(directory, settings, source, n, backend, threads)
+            except BaseException:
+                for leftover in (name + ".part", name + ".lock"):
+                    if (os.path.exists(leftover)): os.remove(leftover)
+                raise
+            pending.remove(n)
+            done += 1
+            progress = True
+
+        # wait only for neighbours another worker is expanding
+        if (progress):
+            waited = 0.0
+        elif (blocked and (wait == None or waited < wait)):
+            time.sleep(poll)
+            waited += poll
+        else:
+            break
+
+    source.close()
+    return done
+
+def stitch(directory):
+    '''Blend the finished tiles into the final image
+
+    Each tile is laid over those before it. Targeted tiles fade in
+    linearly across the overlap; untargeted tiles already agree with
+    their neighbours there, so are laid down as they are.
+
+    Arguments:
+    directory -- work directory written by plan, with every tile finished
+
+    Returns: the stitched Image
+
+    Raises: IOError if a tile is not finished
+    '''
+    settings = _settings(directory)
+    boxes = settings["tiles"]
+    columns = settings["columns"]
+    result = None
+
+    for (n, box) in enumerate(boxes):
+        tile = Image.open(_tileName(directory, n) + ".png")
+        if (result == None):
+            result = Image.new(tile.mode, tuple(settings["size"]))
+
+        # overlap with the tiles to the left and above, if any
+        left = boxes[n - 1][2] - box[0] if n % columns > 0 else 0
+        top = boxes[n - columns][3] - box[1] if n >= columns else 0
+
+        if (settings["targeted"]):
+            mask = Image.new("L", tile.size)
+            mask.putdata([min(_fade(x, left), _fade(y, top))
+                          for y in range(tile.size[1])
+                          for x in range(tile.size[0])])
+        else:
+            mask = None
+        result.paste(tile, (box[0], box[1]), mask)
+    return result
+
+def _expandTile(directory, settings, source, n, backend, threads):
+    '''Expand one claimed tile and write its image into place
+
+    Arguments:
+    directory -- work directory written by plan
+    settings -- dictionary of settings, as written by plan
+    source -- source MappedTexture
+    n -- tile number
+    backend -- name of the kernels backend used for matching
+    threads -- number of threads each pixel's candidates are scanned with
+
+    Preconditions: this worker holds the lock on tile n; for untargeted
+        tiles, every tile from _neighbours is finished
+    Postconditions: tile n is finished and its lock removed
+    '''
+    name = _tileName(directory, n)
+    boxes = settings["tiles"]
+
+    # SquareShape for targeted (looks ahead),
+    # EllShape for untargeted (only looks at initialised)
+    box = tuple(boxes[n])
+    if (settings["targeted"]):
+        target_image = Image.open(os.path.join(directory, "target.png"))
+        target = texture.Texture(target_image.crop(box))
+        shape = texture.SquareShape(settings["nsize"])
+        tlist = None
+    else:
+        target = texture.EmptyTexture((box[2] - box[0], box[3] - box[1]),
+                                      source.pic.mode)
+        shape = texture.EllShape(settings["nsize"])
+        seeded = _seed(directory, boxes, n, target)
+        tlist = [(x,y)
+                 for y in range(target.pic.size[1])
+                 for x in range(target.pic.size[0])
+                 if (x,y) not in seeded]
+    result = expand(source, target, shape, backend, tlist = tlist,
+                    threads = threads)
+
+    # write aside then rename, so a tile image is always complete
+    result.save(name + ".part", "PNG")
+    os.rename(name + ".part", name + ".png")
+    os.remove(name + ".lock")
+
+def _neighbours(boxes, n):
+    '''Find the tiles before a tile that overlap it
+
+    Arguments:
+    boxes -- list of tile boxes, as written by plan
+    n -- tile number
+
+    Returns: list of tile numbers, in order
+    '''
+    box = boxes[n]
+    return [m for m in range(n)
+            if (boxes[m][0] < box[2] and box[0] < boxes[m][2] and
+                boxes[m][1] < box[3] and box[1] < boxes[m][3])]
+
+def _seed(directory, boxes, n, target):
+    '''Copy the pixels a tile shares with finished tiles into its target
+
+    Later tiles are copied over earlier ones, as stitch lays them down.
+
+    Arguments:
+    directory -- work directory written by plan
+    boxes -- list of tile boxes, as written by plan
+    n -- tile number
+    target -- Texture for tile n
+
+    Returns: set of 2-tuple locations in the target that were copied
+
+    Preconditions: every tile from _neighbours(boxes, n) is finished
+    Postconditions: copied pixels are set and marked valid in target
+    '''
+    box = boxes[n]
+    seeded = set()
+    for m in _neighbours(boxes, n):
+        other = boxes[m]
+        tile = texture.Texture(Image.open(_tileName(directory, m) + ".png"))
+        for y in range(max(box[1], other[1]), min(box[3], other[3])):
+            for x in range(max(box[0], other[0]), min(box[2], other[2])):
+                loc = (x - box[0], y - box[1])
+                target.setPixel(tile.getPixel((x - other[0], y - other[1])),
+                                loc)
+                target.setValid(loc)
+                seeded.add(loc)
+    return seeded
+
+def _tileName(directory, n):
+    '''Find the path of a tile's files, less the extension
+
+    Arguments:
+    directory -- work directory written by plan
+    n -- tile number
+
+    Returns: path string
+    '''
+    return os.path.join(directory, "tile_%d" % n)
+
+def _fade(position, overlap):
+    '''Find the opacity of a tile at a position across an overlap
+
+    Arguments:
+    position -- distance into the tile, in pixels
+    overlap -- width of the overlap, in pixels
+
+    Returns: integer opacity, 0 to 255
+    '''
+    if (position >= overlap): return 255
+    return 255 * (position + 1) // (overlap + 1)
+
+def _settings(directory):
+    '''Read the plan of a work directory
+
+    Arguments:
+    directory -- work directory written by plan
+
+    Returns: dictionary of settings, as written by plan
+    '''
+    with open(os.path.join(directory, "plan.json")) as planfile:
+        return json.load(planfile)
+
+if __name__ == '__main__':
+    # additional imports
+    import argparse
+    import kernels
+
+    # use the first line of the docstring as the program description
+    parser = argparse.ArgumentParser(description = __doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest = "command")
+
+    # plan - work directory, source and expansion settings
+    planner = commands.add_parser("plan", help = "split an expansion into tiles")
+    planner.add_argument("directory", help = "the work directory")
+    planner.add_argument("input_file", help = "the source texture file")
+    planner.add_argument("-target", dest = "target_file",
+                         help = "image for target of synthesis")
+    planner.add_argument("-scale", default = 2, type = int,
+                         help = "Scale factor for generated texture (ignored if targeted)")
+    planner.add_argument("-nsize", default = 2, type = int,
+                         help = "Size of neighbourhood used in comparisons")
+    planner.add_argument("-tile", default = 64, type = int,
+                         help = "Edge length of each tile")
+    planner.add_argument("-overlap", default = 8, type = int,
+                         help = "Pixels shared by neighbouring tiles")
+
+    # work - work directory and local settings
+    worker = commands.add_parser("work", help = "expand unclaimed tiles")
+    worker.add_argument("directory", help = "the work directory")
+    worker.add_argument("-tiles", type = int, nargs = "+", metavar = "n",
+                        help = "tile numbers to try (default all)")
+    worker.add_argument("-backend", default = "python",
+                        choices = kernels.available(),
+                        help = "Kernel used to match neighbourhoods")
+    worker.add_argument("-threads", default = 1, type = int,
+                        help = "Number of threads to scan candidates with (ignored by the python backend)")
+    worker.add_argument("-wait", type = float, metavar = "seconds",
+                        help = "Time to wait for neighbouring tiles claimed by other workers (default until they finish)")
+
+    # stitch - work directory and output
+    stitcher = commands.add_parser("stitch", help = "blend finished tiles")
+    stitcher.add_argument("directory", help = "the work directory")
+    stitcher.add_argument("output_file", help = "the destination file")
+
+    args = parser.parse_args()
+    if (args.command == "work" and args.threads < 1):
+        worker.error("-threads must be at least 1")
+
+    if (args.command == "plan"):
+        try:
+            source_image = Image.open(args.input_file)
+        except IOError:
+            print("Could not open input image file", args.input_file)
+            exit(1)
+        target_image = None
+        if (args.target_file != None):
+            try:
+                target_image = Image.open(args.target_file)
+            except IOError:
+                print("Could not open target image file", args.target_file)
+                exit(1)
+        count = plan(args.directory, source_image, target_image, args.scale,
+                     args.tile, args.overlap, args.nsize)
+        print(count, "tiles planned")
+    elif (args.command == "work"):
+        count = work(args.directory, args.tiles, args.backend, args.threads,
+                     args.wait)
+        print("\n", count, "tiles expanded")
+    else:
+        try:
+            stitch(args.directory).save(args.output_file)
+        except IOError:
+            print("Could not stitch tiles into", args.output_file)
+            exit(1)
+
+    exit(0)